@@ -1,7 +1,35 @@
-from datetime import datetime, timedelta
-import pytz
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from datetime import datetime, timedelta, timezone
+from flask import (
+    Flask,
+    Response,
+    abort,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+    get_flashed_messages,
+    session,
+    stream_with_context,
+)
 from flask_sqlalchemy import SQLAlchemy
+from flask_caching import Cache
+from sqlalchemy import (
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import raiseload, selectinload
+from sqlalchemy.pool import QueuePool
 from flask_login import (
     LoginManager,
     UserMixin,
@@ -10,35 +38,185 @@ from flask_login import (
     logout_user,
     current_user,
 )
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerifyMismatchError
 import os
 from dotenv import load_dotenv
 import hashlib
+from functools import lru_cache
+import json
 import secrets
 import random
+import sqlite3
+import time
+from zoneinfo import ZoneInfo
 
 load_dotenv()
 
+
+def build_engine_options(database_url):
+    """DBの種類に応じたコネクションプール設定を返す"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return {}  # インメモリDBは Flask-SQLAlchemy が StaticPool を設定する
+        # ファイルDBも接続を使い回す（既定の NullPool はリクエストごとに open/close）
+        return {
+            "poolclass": QueuePool,
+            "pool_size": 10,
+            "max_overflow": 10,
+            "connect_args": {"check_same_thread": False},
+        }
+    return {
+        "pool_size": 25,
+        "max_overflow": 25,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+
+
 # アプリケーションの初期化
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "default-secret-key")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///data.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = build_engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"]
+)
 
 # ダミーデータ生成フラグ（開発・デモ用）
-# True: ダミーデータを自動生成、False: 生成しない
-GENERATE_DUMMY_DATA = True  # 本番環境では False に変更
+# 環境変数 GENERATE_DUMMY_DATA=1 のときだけ生成する（未設定の本番環境では生成しない）
+GENERATE_DUMMY_DATA = os.getenv("GENERATE_DUMMY_DATA") == "1"
 
 # DB初期化
 db = SQLAlchemy(app)
 
+# SQLite 接続時に設定する PRAGMA（WAL で読み書きを並行させ、fsync を減らす）
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "cache_size=-65536",  # 64MiB
+    "temp_store=MEMORY",
+    "mmap_size=268435456",  # 256MiB
+)
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """新しい SQLite 接続に PRAGMA を設定する（他のDBでは何もしない）"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+# パスワードハッシュ（Argon2id）のパラメータ
+ARGON2_TIME_COST = 2
+ARGON2_MIN_MEMORY_COST = 19456  # OWASP推奨の最小値（KiB）
+# 自動調整の上限（64MiB、同時ログイン時も小さなインスタンスのメモリに収まる大きさ）
+ARGON2_MAX_MEMORY_COST = 65536
+ARGON2_MEMORY_COST_STEP = 4096  # 自動調整で memory_cost を増やす刻み（KiB）
+ARGON2_PARALLELISM = 1
+
+
+def build_password_hasher():
+    """Argon2 の PasswordHasher を生成
+
+    環境変数 ARGON2_AUTOTUNE=1 の場合はホスト上で計測し、ハッシュ1回が
+    ARGON2_TARGET_MS（既定250ms）に収まる最大の memory_cost を
+    ARGON2_MEMORY_COST_STEP 刻みで探す（上限 ARGON2_MAX_MEMORY_COST）。
+    選んだ値は ARGON2_PARAMS_FILE に保存し、次回起動時は計測を省略する。
+    """
+    params = {
+        "time_cost": ARGON2_TIME_COST,
+        "memory_cost": ARGON2_MIN_MEMORY_COST,
+        "parallelism": ARGON2_PARALLELISM,
+    }
+    if os.getenv("ARGON2_AUTOTUNE") != "1":
+        return PasswordHasher(**params)
+
+    params_file = os.getenv("ARGON2_PARAMS_FILE", "argon2_params.json")
+    if os.path.exists(params_file):
+        with open(params_file) as f:
+            saved = json.load(f)
+        # 上限を下げる前に保存されたパラメータも上限内に収める
+        saved["memory_cost"] = min(saved["memory_cost"], ARGON2_MAX_MEMORY_COST)
+        return PasswordHasher(**saved)
+
+    target = int(os.getenv("ARGON2_TARGET_MS", "250")) / 1000
+    memory_cost = params["memory_cost"]
+    while memory_cost < ARGON2_MAX_MEMORY_COST:
+        candidate_cost = min(
+            memory_cost + ARGON2_MEMORY_COST_STEP, ARGON2_MAX_MEMORY_COST
+        )
+        started = time.perf_counter()
+        PasswordHasher(**dict(params, memory_cost=candidate_cost)).hash("benchmark")
+        if time.perf_counter() - started >= target:
+            break
+        memory_cost = candidate_cost
+    params["memory_cost"] = memory_cost
+
+    # 同時起動したワーカーが書きかけを読まないよう一時ファイル経由で置き換える
+    tmp_file = f"{params_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(params, f)
+    os.replace(tmp_file, params_file)
+    return PasswordHasher(**params)
+
+
+_ph = build_password_hasher()
+
+# 存在しないユーザーでのログイン時に照合するダミーハッシュ
+# （実在ユーザーと同じ計算量をかけ、応答時間からユーザーの有無を推測されないようにする）
+_DUMMY_PASSWORD_HASH = _ph.hash(secrets.token_urlsafe(16))
+
+
+def verify_password(password_hash, password):
+    """パスワードハッシュを照合する（旧形式の Werkzeug PBKDF2 にも対応）"""
+    if not password_hash.startswith("$argon2"):
+        return check_password_hash(password_hash, password)
+    try:
+        return _ph.verify(password_hash, password)
+    except (VerifyMismatchError, InvalidHash):
+        return False
+
+
 # ログイン管理初期化
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
 
-# 利用可能なチャンネル
-ALLOWED_CHANNELS = {"general", "job", "class", "circle"}
+
+def build_cache_config(redis_url):
+    """キャッシュ設定を返す
+
+    REDIS_URL があれば gunicorn の全ワーカーで共有できる Redis を使い、
+    削除時の無効化も全ワーカーに反映させる。未設定ならプロセス内メモリを使う
+    """
+    if redis_url:
+        return {
+            "CACHE_TYPE": "RedisCache",
+            "CACHE_REDIS_URL": redis_url,
+            "CACHE_KEY_PREFIX": "connectu:",
+        }
+    return {"CACHE_TYPE": "SimpleCache"}
+
+
+# キャッシュ初期化
+cache = Cache(app, config=build_cache_config(os.getenv("REDIS_URL")))
+
+# 表示用タイムゾーン（フィルター呼び出しごとの生成を避ける）
+_UTC = ZoneInfo("UTC")
+_JST = ZoneInfo("Asia/Tokyo")
+
+# タイムライン・マイページの1ページあたりの表示件数
+TIMELINE_PAGE_SIZE = 20
+
+# 投稿フォームの最大リクエストサイズ（140文字をURLエンコードしても収まる大きさ）
+POST_FORM_MAX_BYTES = 2048
 
 # チャンネル名の日本語変換辞書
 CHANNEL_NAMES_JP = {
@@ -48,26 +226,82 @@ CHANNEL_NAMES_JP = {
     "circle": "サークル",
 }
 
+# 利用可能なチャンネル（日本語名の辞書と定義を一本化）
+ALLOWED_CHANNELS = frozenset(CHANNEL_NAMES_JP)
+
+# チャンネル一覧（表示順固定、テンプレート描画ごとの再生成を避ける）
+_ALL_CHANNELS = tuple(
+    {"code": code, "name": name} for code, name in CHANNEL_NAMES_JP.items()
+)
+
+
+# 匿名ID生成用の鍵（BLAKE2s の鍵は32バイトまでなので SECRET_KEY から導出）
+_ANON_KEY = hashlib.blake2s(app.config["SECRET_KEY"].encode()).digest()
+
+
+@lru_cache(maxsize=65536)
+def make_anonymous_id(label):
+    """ラベル（"post-<ID>" など）から8桁の匿名IDを生成
+
+    鍵付き BLAKE2s で4バイト（16進8桁）のダイジェストを直接得る
+    入力は不変なので結果をプロセス内でキャッシュし、描画ごとのハッシュ計算を省く
+    """
+    hash_obj = hashlib.blake2s(label.encode(), digest_size=4, key=_ANON_KEY)
+    return hash_obj.hexdigest().upper()
+
+
+def utcnow():
+    """現在時刻（UTC、タイムゾーン付き）"""
+    return datetime.now(timezone.utc)
+
 
 def get_channel_display_name(channel_code):
     """チャンネルコードから表示名を取得"""
     return CHANNEL_NAMES_JP.get(channel_code, channel_code)
 
 
+def stream_template(template_name, **context):
+    """テンプレートを逐次レンダリングして返す（Flask 2.2 の stream_template 相当）"""
+    # セッションはレスポンス本文の送信前に保存されるため、
+    # フラッシュメッセージは先に取り出しておく（テンプレート側はこの結果を再利用する）
+    get_flashed_messages(with_categories=True)
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return stream_with_context(template.stream(context))
+
+
+def jst_expression(column):
+    """UTCの日時列をJSTの表示文字列に変換するSQL式（jst フィルターと同じ書式）"""
+    if db.engine.dialect.name == "postgresql":
+        # timestamptz 列なので AT TIME ZONE 'Asia/Tokyo' でJSTの時刻になる
+        return func.to_char(func.timezone("Asia/Tokyo", column), "YYYY/MM/DD HH24:MI")
+    # SQLite
+    return func.strftime("%Y/%m/%d %H:%M", column, "+9 hours")
+
+
 # モデル定義
 class User(UserMixin, db.Model):
     __tablename__ = "users"
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, index=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    posts = db.relationship("Post", backref="author", lazy="dynamic")
+    password_hash = db.Column(db.String(256), nullable=False)
+    # 一覧表示に使う関連は各ビューのクエリで必要な分だけ読み込む
+    posts = db.relationship("Post", back_populates="author")
+    likes = db.relationship("Like", back_populates="user")
+    comments = db.relationship("Comment", back_populates="user")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = _ph.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """旧形式・旧パラメータのハッシュかどうかを判定"""
+        if not self.password_hash.startswith("$argon2"):
+            return True
+        return _ph.check_needs_rehash(self.password_hash)
 
 
 class Post(db.Model):
@@ -76,20 +310,47 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(
-        db.DateTime, index=True, default=datetime.utcnow, nullable=False
+        db.DateTime(timezone=True), index=True, default=utcnow, nullable=False
     )
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     channel = db.Column(db.String(20), nullable=False, default="general", index=True)
     # 削除フラグを追加
     is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
-    deleted_at = db.Column(db.DateTime, nullable=True)
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    author = db.relationship("User", back_populates="posts")
+    # いいねは件数・自分のいいね有無を別クエリで集計するため、行は読み込まない
+    likes = db.relationship("Like", back_populates="post")
+    # コメントは一覧表示時のみ post_list_options() の selectinload でまとめて取得
+    comments = db.relationship(
+        "Comment",
+        back_populates="post",
+        order_by="Comment.timestamp",
+    )
+
+    # タイムライン（全件・チャンネル絞り込み）とマイページの
+    # 絞り込み＋並び替え（投稿日時→ID の降順）を複合インデックスだけで処理する
+    __table_args__ = (
+        db.Index("ix_posts_active_ts_id", is_deleted, timestamp.desc(), id.desc()),
+        db.Index(
+            "ix_posts_channel_active_ts_id",
+            channel,
+            is_deleted,
+            timestamp.desc(),
+            id.desc(),
+        ),
+        db.Index(
+            "ix_posts_user_active_ts_id",
+            user_id,
+            is_deleted,
+            timestamp.desc(),
+            id.desc(),
+        ),
+    )
 
     def get_anonymous_id(self):
         """投稿IDベースの匿名ID生成（投稿ごとに一意）"""
-        secret_key = app.config["SECRET_KEY"]
-        raw_string = f"post-{self.id}-{secret_key}"
-        hash_obj = hashlib.sha256(raw_string.encode())
-        return hash_obj.hexdigest()[:8].upper()
+        return make_anonymous_id(f"post-{self.id}")
 
     def get_display_name(self):
         """表示用の匿名名前を取得"""
@@ -107,8 +368,13 @@ class Like(db.Model):
         db.Integer, db.ForeignKey("posts.id"), nullable=False, index=True
     )
 
-    user = db.relationship("User", backref=db.backref("likes", lazy="dynamic"))
-    post = db.relationship("Post", backref=db.backref("likes", lazy="dynamic"))
+    user = db.relationship("User", back_populates="likes")
+    post = db.relationship("Post", back_populates="likes")
+
+    # 同じユーザーが同じ投稿に重複していいねできないようにする
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "post_id", name="uq_like_user_post"),
+    )
 
 
 # コメントモデル
@@ -117,7 +383,7 @@ class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(
-        db.DateTime, index=True, default=datetime.utcnow, nullable=False
+        db.DateTime(timezone=True), index=True, default=utcnow, nullable=False
     )
     # user_idを復活（内部管理用、表示は匿名ID）
     user_id = db.Column(
@@ -131,24 +397,57 @@ class Comment(db.Model):
     )
 
     # userとの関連を復活
-    user = db.relationship("User", backref=db.backref("comments", lazy="joined"))
-    post = db.relationship("Post", backref=db.backref("comments", lazy="dynamic"))
+    user = db.relationship("User", back_populates="comments")
+    post = db.relationship("Post", back_populates="comments")
 
     def get_anonymous_id(self):
         """コメントIDベースの匿名ID生成（コメントごとに一意）"""
-        secret_key = app.config["SECRET_KEY"]
-        raw_string = f"comment-{self.post_id}-{self.id}-{secret_key}"
-        hash_obj = hashlib.sha256(raw_string.encode())
-        return hash_obj.hexdigest()[:8].upper()
+        return make_anonymous_id(f"comment-{self.post_id}-{self.id}")
 
     def get_display_name(self):
         """表示用の匿名名前を取得"""
         return f"返信{self.get_anonymous_id()}"
 
 
+def post_list_options():
+    """投稿一覧の表示に必要な関連をまとめて読み込むクエリオプション
+
+    ここで指定していない関連を参照すると例外になるため、
+    テンプレートで新たな関連を使う場合はここに追加すること
+    """
+    return (
+        selectinload(Post.author),
+        selectinload(Post.comments),
+        raiseload("*"),
+    )
+
+
+def count_likes(post_ids):
+    """投稿IDごとのいいね数を1回の GROUP BY で取得（いいねの行は読み込まない）"""
+    if not post_ids:
+        return {}
+    return dict(
+        db.session.query(Like.post_id, func.count())
+        .filter(Like.post_id.in_(post_ids))
+        .group_by(Like.post_id)
+    )
+
+
+def liked_post_ids(user_id, post_ids):
+    """指定ユーザーがいいね済みの投稿IDの集合を1回のクエリで取得"""
+    if not post_ids:
+        return set()
+    return {
+        post_id
+        for (post_id,) in db.session.query(Like.post_id).filter(
+            Like.user_id == user_id, Like.post_id.in_(post_ids)
+        )
+    }
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
 
 
 # ルート定義
@@ -172,16 +471,23 @@ def register():
             flash("ユーザー名とパスワードを入力してください")
             return redirect(url_for("register"))
 
-        # 既存ユーザーチェック
-        if User.query.filter_by(username=username).first():
+        # 既存ユーザーチェック（行は取得せず EXISTS で存在だけを確認）
+        if db.session.query(
+            db.session.query(User.id).filter_by(username=username).exists()
+        ).scalar():
             flash("そのユーザー名は既に使用されています")
             return redirect(url_for("register"))
 
-        # 新規ユーザー作成
+        # 新規ユーザー作成（同時登録による重複はユニーク制約で検出）
         user = User(username=username)
         user.set_password(password)
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash("そのユーザー名は既に使用されています")
+            return redirect(url_for("register"))
 
         flash("アカウントの登録が完了しました。ログインしてください。")
         return redirect(url_for("login"))
@@ -198,12 +504,23 @@ def login():
         username = request.form.get("username") or ""
         password = request.form.get("password") or ""
 
-        user = User.query.filter_by(username=username).first()
+        user = db.session.execute(
+            select(User).where(User.username == username)
+        ).scalar_one_or_none()
 
-        if user is None or not user.check_password(password):
+        # ユーザーの有無にかかわらず必ず1回ハッシュを照合してから判定する
+        password_ok = verify_password(
+            user.password_hash if user else _DUMMY_PASSWORD_HASH, password
+        )
+        if user is None or not password_ok:
             flash("ユーザー名またはパスワードが正しくありません")
             return redirect(url_for("login"))
 
+        # 旧形式のハッシュはログイン成功時に Argon2 へ移行
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+
         login_user(user)
         return redirect(url_for("timeline"))
 
@@ -217,25 +534,85 @@ def logout():
     return redirect(url_for("login"))
 
 
+def get_before_cursor():
+    """?before=<ISO形式の日時>_<投稿ID> を読み取る（未指定・不正値は None）"""
+    timestamp, _, post_id = request.args.get("before", "").rpartition("_")
+    try:
+        return datetime.fromisoformat(timestamp), int(post_id)
+    except ValueError:
+        return None
+
+
+def format_before_cursor(timestamp, post_id):
+    """次ページ用のカーソル文字列（get_before_cursor の逆変換）"""
+    return f"{timestamp.isoformat()}_{post_id}"
+
+
+def older_than(cursor):
+    """カーソルより古い投稿の条件（同時刻の投稿は ID の大小で順序を決める）
+
+    行値比較にして、複合インデックスの1回の範囲検索で済むようにする
+    """
+    timestamp, post_id = cursor
+    return tuple_(Post.timestamp, Post.id) < tuple_(timestamp, post_id)
+
+
+@cache.memoize(timeout=30)
+def timeline_post_ids(channel, max_id, before=None):
+    """タイムラインに表示する投稿の (ID, 投稿日時) を新しい順で1ページ分取得
+
+    キーに最新の投稿IDを含めるため、新規投稿があれば自動的に別キーになる
+    before に (投稿日時, ID) を指定するとそれより古い投稿のみを返す（キーセットページング）
+    """
+    query = db.session.query(Post.id, Post.timestamp).filter_by(is_deleted=False)
+    if channel:
+        query = query.filter_by(channel=channel)
+    if before:
+        query = query.filter(older_than(before))
+    query = query.order_by(Post.timestamp.desc(), Post.id.desc()).limit(
+        TIMELINE_PAGE_SIZE
+    )
+    return [tuple(row) for row in query]
+
+
 @app.route("/timeline")
 @login_required
 def timeline():
     # クエリパラメータ ?channel=general などで絞り込み
     selected_channel = request.args.get("channel", None)
-    if selected_channel in ALLOWED_CHANNELS:
-        posts = (
-            Post.query.filter_by(channel=selected_channel, is_deleted=False)
-            .order_by(Post.timestamp.desc())
-            .all()
-        )
-    else:
-        posts = (
-            Post.query.filter_by(is_deleted=False).order_by(Post.timestamp.desc()).all()
-        )
+    if selected_channel not in ALLOWED_CHANNELS:
         selected_channel = None  # 無効値は未選択扱い
 
-    return render_template(
-        "timeline.html", posts=posts, selected_channel=selected_channel
+    max_id = db.session.query(func.max(Post.id)).scalar()
+    page = timeline_post_ids(selected_channel, max_id, get_before_cursor())
+    post_ids = [post_id for post_id, _ in page]
+    # 1ページ分埋まっていれば、最も古い投稿の (日時, ID) を次ページのカーソルにする
+    next_before = (
+        format_before_cursor(page[-1][1], page[-1][0])
+        if len(page) == TIMELINE_PAGE_SIZE
+        else None
+    )
+
+    # 投稿者・いいね・コメントは selectinload でまとめて取得（投稿ごとの SELECT を防ぐ）
+    # 表示用の投稿日時（JST）はSQL側で整形して (Post, 文字列) の組で渡す
+    # 1ページ分をストリーミングで描画し、最初の部分をすぐに送信する
+    posts = (
+        db.session.query(Post, jst_expression(Post.timestamp).label("ts_jst"))
+        .options(*post_list_options())
+        # IDの一覧は最大30秒キャッシュされるため、削除済みかどうかはここで再確認する
+        .filter(Post.id.in_(post_ids), Post.is_deleted.is_(False))
+        .order_by(Post.timestamp.desc(), Post.id.desc())
+    )
+
+    return Response(
+        stream_template(
+            "timeline.html",
+            posts=posts,
+            like_counts=count_likes(post_ids),
+            liked_ids=liked_post_ids(current_user.id, post_ids),
+            selected_channel=selected_channel,
+            next_before=next_before,
+        )
     )
 
 
@@ -243,6 +620,15 @@ def timeline():
 @login_required
 def post():
     if request.method == "POST":
+        # 明らかに大きすぎるリクエストはフォームを解析する前に拒否
+        # （長さを申告しない chunked 送信もサイズを確認できないため同様に扱う）
+        if (
+            request.content_length is None
+            or request.content_length > POST_FORM_MAX_BYTES
+        ):
+            flash("投稿は140文字以内にしてください")
+            return redirect(url_for("post"))
+
         content = (request.form.get("content") or "").strip()
         channel = request.form.get("channel", "general")
 
@@ -277,18 +663,37 @@ def post():
 @app.route("/mypage")
 @login_required
 def mypage():
-    posts = (
-        Post.query.filter_by(user_id=current_user.id, is_deleted=False)
-        .order_by(Post.timestamp.desc())
-        .all()
+    # current_user.posts（dynamic）は使わず、1ページ分だけを直接取得する
+    query = (
+        select(Post, jst_expression(Post.timestamp).label("ts_jst"))
+        .options(*post_list_options())
+        .filter_by(user_id=current_user.id, is_deleted=False)
+    )
+    before = get_before_cursor()
+    if before:
+        query = query.where(older_than(before))
+    posts = db.session.execute(
+        query.order_by(Post.timestamp.desc(), Post.id.desc()).limit(TIMELINE_PAGE_SIZE)
+    ).all()
+    like_counts = count_likes([row.Post.id for row in posts])
+    next_before = (
+        format_before_cursor(posts[-1].Post.timestamp, posts[-1].Post.id)
+        if len(posts) == TIMELINE_PAGE_SIZE
+        else None
+    )
+    return render_template(
+        "mypage.html",
+        posts=posts,
+        like_counts=like_counts,
+        user=current_user,
+        next_before=next_before,
     )
-    return render_template("mypage.html", posts=posts, user=current_user)
 
 
 @app.route("/delete_post/<int:post_id>", methods=["POST"])
 @login_required
 def delete_post(post_id):
-    post = Post.query.get_or_404(post_id)
+    post = db.session.get(Post, post_id) or abort(404)
 
     # 投稿者本人のみ削除可能
     if post.author != current_user:
@@ -297,8 +702,10 @@ def delete_post(post_id):
 
     # 論理削除（削除フラグを立てる）
     post.is_deleted = True
-    post.deleted_at = datetime.utcnow()
+    post.deleted_at = utcnow()
     db.session.commit()
+    # 削除では最新の投稿IDが変わらないため明示的にキャッシュを破棄
+    cache.delete_memoized(timeline_post_ids)
 
     flash("投稿を削除しました")
 
@@ -316,7 +723,10 @@ def delete_post(post_id):
 def admin_deleted_posts():
     # 管理者権限チェックは別途実装
     deleted_posts = (
-        Post.query.filter_by(is_deleted=True).order_by(Post.deleted_at.desc()).all()
+        Post.query.options(*post_list_options())
+        .filter_by(is_deleted=True)
+        .order_by(Post.deleted_at.desc())
+        .all()
     )
     return render_template("admin/deleted_posts.html", posts=deleted_posts)
 
@@ -326,14 +736,11 @@ def jst(datetime_utc):
     if datetime_utc is None:
         return ""
 
-    utc = pytz.utc
+    # SQLite はタイムゾーンを保存しないため naive な UTC として読み出される
     if datetime_utc.tzinfo is None:
-        datetime_utc = utc.localize(datetime_utc)
+        datetime_utc = datetime_utc.replace(tzinfo=_UTC)
 
-    jst = pytz.timezone("Asia/Tokyo")
-    datetime_jst = datetime_utc.astimezone(jst)
-
-    return datetime_jst.strftime("%Y/%m/%d %H:%M")
+    return datetime_utc.astimezone(_JST).strftime("%Y/%m/%d %H:%M")
 
 
 @app.template_filter("channel_jp")
@@ -345,22 +752,39 @@ def channel_jp(channel_code):
 @app.template_global()
 def get_all_channels():
     """すべてのチャンネル情報を取得（将来の動的チャンネル対応）"""
-    return [
-        {"code": code, "name": get_channel_display_name(code)}
-        for code in ALLOWED_CHANNELS
-    ]
+    return _ALL_CHANNELS
+
+
+# ON CONFLICT DO NOTHING に対応した方言ごとの INSERT
+_ON_CONFLICT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
 
 
 # いいね（トグル）
 @app.route("/like/<int:post_id>", methods=["POST"])
 @login_required
 def like(post_id):
-    post = Post.query.get_or_404(post_id)
-    existing = Like.query.filter_by(user_id=current_user.id, post_id=post.id).first()
-    if existing:
-        db.session.delete(existing)  # 解除
-    else:
-        db.session.add(Like(user_id=current_user.id, post_id=post.id))
+    post = db.session.get(Post, post_id) or abort(404)
+    values = {"user_id": current_user.id, "post_id": post.id}
+    unlike = delete(Like).where(
+        Like.user_id == current_user.id, Like.post_id == post.id
+    )
+    upsert_insert = _ON_CONFLICT_INSERTS.get(db.engine.dialect.name)
+    if upsert_insert is not None:
+        # 重複を無視して追加を試み、既にいいね済みなら解除（1往復で済ませる）
+        result = db.session.execute(
+            upsert_insert(Like)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+        )
+        if result.rowcount == 0:
+            db.session.execute(unlike)
+    # ON CONFLICT 非対応のDBでは解除を試み、削除対象がなければ追加
+    elif db.session.execute(unlike).rowcount == 0:
+        try:
+            db.session.execute(insert(Like).values(**values))
+        except IntegrityError:
+            # 連打などで同時に追加された場合は既にいいね済みとして扱う
+            db.session.rollback()
     db.session.commit()
     # 元のチャンネルを保つ
     return redirect(request.referrer or url_for("timeline", channel=post.channel))
@@ -370,14 +794,14 @@ def like(post_id):
 @app.route("/comment/<int:post_id>", methods=["POST"])
 @login_required
 def comment(post_id):
-    post = Post.query.get_or_404(post_id)
+    post = db.session.get(Post, post_id) or abort(404)
     content = (request.form.get("content") or "").strip()
     if not content:
         flash("コメント内容を入力してください")
         return redirect(request.referrer or url_for("timeline", channel=post.channel))
 
-    # セッションIDを生成（予備用）
-    comment_session_id = secrets.token_urlsafe(32)
+    # セッションIDを生成（予備用、128bit で十分な一意性がある）
+    comment_session_id = secrets.token_urlsafe(16)
 
     # コメントの作成（user_idも保存、表示は匿名ID）
     new_comment = Comment(
@@ -397,23 +821,32 @@ def create_dummy_data():
     if not GENERATE_DUMMY_DATA:
         return
 
-    # 既にデータが存在する場合はスキップ
-    if Post.query.first():
+    # 既にデータが存在する場合はスキップ（IDのみで存在確認）
+    if db.session.query(Post.id).first():
         return
 
     print("Generating dummy data...")
 
     # ダミーユーザーを作成
-    dummy_users = []
-    for i in range(5):
-        username = f"user{i+1}"
-        if not User.query.filter_by(username=username).first():
+    usernames = [f"user{i+1}" for i in range(5)]
+    existing = set(
+        db.session.execute(
+            select(User.username).where(User.username.in_(usernames))
+        ).scalars()
+    )
+    for username in usernames:
+        if username not in existing:
             user = User(username=username)
             user.set_password("password123")
             db.session.add(user)
-            dummy_users.append(user)
 
-    db.session.commit()
+    # コミットは最後に1回だけ行い、ここでは採番のために flush のみ
+    db.session.flush()
+    # 以降は ORM オブジェクトを作らず、IDだけを使って行データを組み立てる
+    user_ids = [
+        user_id
+        for (user_id,) in db.session.query(User.id).filter(User.username.in_(usernames))
+    ]
 
     # 各チャンネルのダミー投稿データ
     dummy_posts = {
@@ -481,60 +914,122 @@ def create_dummy_data():
         "お疲れ様です",
     ]
 
-    # ダミー投稿を作成
-    all_posts = []
-    for channel, posts in dummy_posts.items():
-        for content in posts:
-            user = random.choice(dummy_users)
-            post = Post(
-                content=content,
-                author=user,
-                channel=channel,
-                timestamp=datetime.utcnow()
-                - timedelta(
-                    days=random.randint(0, 30),
-                    hours=random.randint(0, 23),
-                    minutes=random.randint(0, 59),
-                ),
-            )
-            db.session.add(post)
-            all_posts.append(post)
+    # ダミー投稿を作成（Core の一括 INSERT）
+    post_rows = [
+        {
+            "content": content,
+            "user_id": random.choice(user_ids),
+            "channel": channel,
+            "timestamp": utcnow()
+            - timedelta(
+                days=random.randint(0, 30),
+                hours=random.randint(0, 23),
+                minutes=random.randint(0, 59),
+            ),
+        }
+        for channel, posts in dummy_posts.items()
+        for content in posts
+    ]
+    db.session.execute(Post.__table__.insert(), post_rows)
 
-    db.session.commit()
+    # 採番された投稿IDを同じトランザクション内で取得
+    # （投稿が空の状態から作成しているため全件がダミー）
+    all_posts = db.session.query(Post.id, Post.timestamp).all()
 
     # ダミーコメントを作成
-    for post in all_posts:
+    comment_rows = []
+    for post_id, post_timestamp in all_posts:
         # 各投稿に0〜5個のコメントをランダムに追加
         comment_count = random.randint(0, 5)
         for _ in range(comment_count):
-            commenter = random.choice(dummy_users)
-            comment_content = random.choice(dummy_comments)
-            comment = Comment(
-                content=comment_content,
-                user_id=commenter.id,
-                post_id=post.id,
-                session_id=secrets.token_urlsafe(32),
-                timestamp=post.timestamp + timedelta(hours=random.randint(1, 48)),
+            comment_rows.append(
+                {
+                    "content": random.choice(dummy_comments),
+                    "user_id": random.choice(user_ids),
+                    "post_id": post_id,
+                    "session_id": None,  # ダミーデータでは使わない
+                    "timestamp": post_timestamp
+                    + timedelta(hours=random.randint(1, 48)),
+                }
             )
-            db.session.add(comment)
+    if comment_rows:
+        db.session.execute(Comment.__table__.insert(), comment_rows)
 
     # ダミーいいねを作成
-    for post in all_posts:
+    like_rows = []
+    for post_id, _ in all_posts:
         # 各投稿に0〜8個のいいねをランダムに追加
         like_count = random.randint(0, 8)
-        users_who_liked = random.sample(dummy_users, min(like_count, len(dummy_users)))
-        for user in users_who_liked:
-            like = Like(user_id=user.id, post_id=post.id)
-            db.session.add(like)
+        users_who_liked = random.sample(user_ids, min(like_count, len(user_ids)))
+        for user_id in users_who_liked:
+            like_rows.append({"user_id": user_id, "post_id": post_id})
+    if like_rows:
+        db.session.execute(Like.__table__.insert(), like_rows)
 
     db.session.commit()
     print(f"Generated {len(all_posts)} dummy posts with comments and likes!")
 
 
-# アプリケーション起動時にDBを作成（初回のみテーブル作成）
-with app.app_context():
+def ensure_like_unique_index():
+    """likes に (user_id, post_id) のユニーク制約がなければ追加する
+
+    create_all は既存テーブルに制約を追加しないため、いいねの
+    ON CONFLICT が前提とする一意性を既存DBでもここで保証する
+    """
+    columns = ["user_id", "post_id"]
+    inspector = inspect(db.engine)
+    if any(
+        constraint["column_names"] == columns
+        for constraint in inspector.get_unique_constraints("likes")
+    ) or any(
+        index["unique"] and index["column_names"] == columns
+        for index in inspector.get_indexes("likes")
+    ):
+        return False
+    with db.engine.begin() as conn:
+        # 既存の重複いいねを1件に絞ってからユニークインデックスを作成
+        conn.execute(
+            text(
+                "DELETE FROM likes WHERE id NOT IN "
+                "(SELECT MIN(id) FROM likes GROUP BY user_id, post_id)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_like_user_post "
+                "ON likes (user_id, post_id)"
+            )
+        )
+    return True
+
+
+def init_db():
+    """テーブルを作成し（初回のみ）、既存DBに不足しているユニーク制約を補う"""
     db.create_all()
-    create_dummy_data()  # ダミーデータ生成
+    ensure_like_unique_index()
+
+
+# DB初期化はワーカー起動ごとではなくデプロイ時に一度だけ実行する
+@app.cli.command("init-db")
+def init_db_command():
+    """DBを初期化する（flask init-db）"""
+    init_db()
+    print("Initialized the database.")
+
+
+# ダミーデータ投入は明示的に実行したときだけ行う（GENERATE_DUMMY_DATA が安全装置）
+@app.cli.command("seed")
+def seed_command():
+    """ダミーデータを生成する（flask seed）"""
+    if not GENERATE_DUMMY_DATA:
+        print("GENERATE_DUMMY_DATA is not set to 1; skipped.")
+        return
+    create_dummy_data()
+
 
 if __name__ == "__main__":
+    # 開発用サーバーでは起動時に初期化し、ダミーデータも用意する
+    with app.app_context():
+        init_db()
+        create_dummy_data()
     app.run()  # 開発中のみ debug=True を検討
@@ -1,15 +1,136 @@
 # 一度だけ実行するマイグレーションスクリプト
-from app import app, db
+# 使い方: python migrate_db.py [マイグレーション名]（省略時は add_delete_columns）
+import sys
+
+from sqlalchemy import text
+
+from app import app, db, ensure_like_unique_index
+
+# タイムライン・マイページ用の複合インデックス
+# （削除フラグと、同時刻の投稿の順序を決める ID まで含めて並び替えを省く）
+TIMELINE_INDEXES = {
+    "ix_posts_active_ts_id": "posts (is_deleted, timestamp DESC, id DESC)",
+    "ix_posts_channel_active_ts_id": (
+        "posts (channel, is_deleted, timestamp DESC, id DESC)"
+    ),
+    "ix_posts_user_active_ts_id": (
+        "posts (user_id, is_deleted, timestamp DESC, id DESC)"
+    ),
+}
+
+# 上の複合インデックスで置き換えた旧インデックス
+SUPERSEDED_INDEXES = (
+    "ix_posts_channel_ts",
+    "ix_posts_user_ts",
+    "ix_posts_active_ts",
+    "ix_posts_channel_active_ts",
+    "ix_posts_user_active_ts",
+)
+
+# タイムゾーン付きに変換する日時列（既存値はUTCとして解釈）
+TIMESTAMP_COLUMNS = {
+    "posts": ("timestamp", "deleted_at"),
+    "comments": ("timestamp",),
+}
 
 
 def add_delete_columns():
     with app.app_context():
-        # SQLiteの場合の例
-        db.engine.execute("ALTER TABLE posts ADD COLUMN is_deleted BOOLEAN DEFAULT 0")
-        db.engine.execute("ALTER TABLE posts ADD COLUMN deleted_at DATETIME")
-        db.session.commit()
+        if db.engine.dialect.name == "postgresql":
+            datetime_type = "TIMESTAMP WITH TIME ZONE"
+        else:
+            datetime_type = "DATETIME"
+        # 列追加とインデックス作成を1つのトランザクションでまとめて実行
+        with db.engine.begin() as conn:
+            conn.execute(
+                text(
+                    "ALTER TABLE posts "
+                    "ADD COLUMN is_deleted BOOLEAN DEFAULT FALSE NOT NULL"
+                )
+            )
+            conn.execute(
+                text(f"ALTER TABLE posts ADD COLUMN deleted_at {datetime_type}")
+            )
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_posts_is_deleted "
+                    "ON posts (is_deleted)"
+                )
+            )
+        print("Migration completed successfully")
+
+
+def add_timeline_indexes():
+    with app.app_context():
+        if db.engine.dialect.name == "postgresql":
+            # CONCURRENTLY はトランザクション外で実行する必要がある
+            conn = db.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+            create = "CREATE INDEX CONCURRENTLY IF NOT EXISTS"
+            drop = "DROP INDEX CONCURRENTLY IF EXISTS"
+        else:
+            conn = db.engine.connect()
+            create = "CREATE INDEX IF NOT EXISTS"
+            drop = "DROP INDEX IF EXISTS"
+        with conn, conn.begin():
+            for name, target in TIMELINE_INDEXES.items():
+                conn.execute(text(f"{create} {name} ON {target}"))
+            for name in SUPERSEDED_INDEXES:
+                conn.execute(text(f"{drop} {name}"))
+            # 統計情報を更新して新しいインデックスが選ばれるようにする
+            conn.execute(text("ANALYZE posts"))
+        print("Migration completed successfully")
+
+
+def convert_timestamps_to_timestamptz():
+    with app.app_context():
+        # SQLite はタイムゾーン型を持たないため変換不要
+        if db.engine.dialect.name != "postgresql":
+            print("Nothing to migrate")
+            return
+        with db.engine.begin() as conn:
+            for table, columns in TIMESTAMP_COLUMNS.items():
+                for column in columns:
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table} ALTER COLUMN {column} "
+                            "TYPE TIMESTAMP WITH TIME ZONE "
+                            f"USING {column} AT TIME ZONE 'UTC'"
+                        )
+                    )
         print("Migration completed successfully")
 
 
+def add_like_unique_constraint():
+    with app.app_context():
+        # 重複の整理とインデックス作成は flask init-db と共通の処理を使う
+        if ensure_like_unique_index():
+            print("Migration completed successfully")
+        else:
+            print("Nothing to migrate")
+
+
+def widen_password_hash():
+    with app.app_context():
+        # SQLite は VARCHAR の長さを強制しないため変更不要
+        if db.engine.dialect.name != "postgresql":
+            print("Nothing to migrate")
+            return
+        with db.engine.begin() as conn:
+            conn.execute(
+                text("ALTER TABLE users ALTER COLUMN password_hash TYPE VARCHAR(256)")
+            )
+        print("Migration completed successfully")
+
+
+MIGRATIONS = {
+    "add_delete_columns": add_delete_columns,
+    "add_timeline_indexes": add_timeline_indexes,
+    "convert_timestamps_to_timestamptz": convert_timestamps_to_timestamptz,
+    "add_like_unique_constraint": add_like_unique_constraint,
+    "widen_password_hash": widen_password_hash,
+}
+
+
 if __name__ == "__main__":
-    add_delete_columns()
+    name = sys.argv[1] if len(sys.argv) > 1 else "add_delete_columns"
+    MIGRATIONS[name]()